@@ -2,11 +2,16 @@ import os
 import sys
 import aiohttp
 import asyncio
-import google.generativeai as genai
 import logging
+import orjson
 import base64
-import json
-from collections import Counter
+import hashlib
+import random
+import sqlite3
+import time
+from collections import Counter, namedtuple
+from contextlib import asynccontextmanager, closing
+from functools import lru_cache
 from datetime import datetime
 
 # ----------------------------------------------------------------------
@@ -22,68 +27,240 @@ GH_API_TOKEN = os.environ.get('GH_API_TOKEN')
 DISCORD_WEBHOOK_URL = os.environ.get('DISCORD_WEBHOOK_URL')
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 
-# Gemini AI 설정
-if GEMINI_API_KEY:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        logger.info("Gemini API configured successfully.")
-    except Exception as e:
-        logger.error(f"Failed to configure Gemini API: {e}")
-        model = None
-else:
-    logger.error("GEMINI_API_KEY is not set. AI review will not be available.")
-    model = None
+# Gemini AI 설정 (SDK 없이 REST API를 공유 세션으로 직접 호출)
+GEMINI_MODEL = 'gemini-2.5-flash'
+GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+
+# Gemini 리뷰 요청 프롬프트 (diff 앞뒤에 붙는 고정 문자열)
+REVIEW_PROMPT_PREFIX = """
+As an expert code reviewer, please analyze the following code changes (`git diff` format, unchanged context lines omitted).
+Provide your feedback in Korean, using markdown for clarity. Structure your review with these sections:
+
+1.  **📝 변경사항 요약 (Summary):** Briefly describe the main purpose of these changes.
+2.  **✅ 좋은 점 (Pros):** Point out well-implemented parts or good practices.
+3.  **🤔 개선 제안 (Suggestions):** Suggest improvements for readability, performance, or potential issues.
+4.  **❓ 질문 (Questions):** Ask questions if the intent of the code is unclear.
+
+---
+
+**Code Changes:**
+```diff
+"""
+REVIEW_PROMPT_SUFFIX = """
+```
+"""
+
+# 코드 리뷰에서 제외할 리소스 파일 확장자
+RESOURCE_EXTENSIONS = frozenset({
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp', '.ico', '.svg',
+    '.mp3', '.wav', '.ogg', '.m4a', '.aac', '.wma', '.flac', '.aiff', '.mid', '.midi',
+    '.unity3d', '.bank', '.fsb', '.vag', '.xma', '.xwb',
+    '.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm',
+    '.unity', '.prefab', '.asset', '.mat', '.anim', '.controller', '.mask', '.meta',
+    '.fbx', '.obj', '.blend', '.tga', '.psd', '.ai', '.pdf',
+    '.zip', '.rar', '.7z', '.tar', '.gz',
+    '.exe', '.dll', '.so', '.dylib', '.bin'
+})
+
+# 코드 리뷰에서 제외할 리소스 디렉터리 (str.startswith에 바로 넘길 수 있도록 tuple)
+RESOURCE_DIRS = (
+    'Assets/Resources', 'Assets/StreamingAssets', 'Assets/Textures', 'Assets/Models',
+    'Assets/Animations', 'Assets/Audio', 'Assets/Scenes', 'Assets/Prefabs',
+    'Assets/Materials', 'Assets/Sprites', 'Library', 'Temp', 'Logs'
+)
+
+# 확장자별 파일 타입
+FILE_TYPE_EXTENSIONS = {
+    '.py': 'python', '.js': 'javascript', '.html': 'html', '.css': 'css',
+    '.ts': 'typescript', '.jsx': 'react', '.tsx': 'react', '.java': 'java',
+    '.c': 'c', '.cpp': 'cpp', '.cs': 'csharp', '.go': 'go', '.rs': 'rust',
+    '.rb': 'ruby', '.php': 'php', '.sql': 'sql', '.shader': 'unity-shader',
+    '.anim': 'unity-animation', '.prefab': 'unity-prefab', '.mat': 'unity-material',
+    '.asset': 'unity-asset', '.unity': 'unity-scene'
+}
+
+# 확장자별 (리소스 여부, 파일 타입) - classify_path에서 한 번의 조회로 사용
+EXTENSION_INFO = {
+    ext: (ext in RESOURCE_EXTENSIONS, FILE_TYPE_EXTENSIONS.get(ext))
+    for ext in RESOURCE_EXTENSIONS | FILE_TYPE_EXTENSIONS.keys()
+}
+
+# Unity 관련 파일을 판별하는 경로 패턴
+UNITY_RELATED_PATTERNS = (
+    'Assets/', '.cs', '.shader', '.anim', '.prefab', '.mat', '.unity',
+    'ProjectSettings/', 'Packages/', 'Assembly-CSharp', 'ScriptableObject'
+)
+
+# diff 파일 헤더 줄의 시작 (diff --git a/<경로> b/<경로>)
+DIFF_HEADER = b'diff --git '
+
+# Discord embed 하나에 담을 리뷰 텍스트 최대 길이
+DISCORD_MESSAGE_MAX_LENGTH = 1900
+
+# Discord 메시지 하나에 담을 수 있는 embed 최대 개수 및 총 문자 수
+DISCORD_MAX_EMBEDS = 10
+DISCORD_MAX_EMBED_CHARS = 6000
+
+# GitHub API 속도 제한 및 재시도 설정
+GH_RATE_LIMIT_PER_SEC = 10  # 클라이언트 측 초당 최대 요청 수
+GH_MAX_RETRIES = 5
+GH_MAX_BACKOFF = 60  # 재시도 대기 최대 시간 (초)
+GH_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# GitHub API 동시 요청 수 (2차 속도 제한 회피, 잘못된 값이면 기본값 8, 최소 1)
+try:
+    GH_MAX_CONCURRENCY = max(int(os.environ.get('GH_MAX_CONCURRENCY') or 8), 1)
+except ValueError:
+    logger.warning(f"Invalid GH_MAX_CONCURRENCY value {os.environ.get('GH_MAX_CONCURRENCY')!r}. Using default 8.")
+    GH_MAX_CONCURRENCY = 8
+
+# 리뷰 캐시 설정 (동일한 diff에 대해 Gemini 재호출 방지)
+REVIEW_CACHE_PATH = os.path.join(os.environ.get('GITHUB_WORKSPACE', '.'), '.review_cache.sqlite')
+REVIEW_CACHE_TTL = 7 * 24 * 60 * 60  # 7일 (초)
+
+# 모든 GitHub / Discord / Gemini 호출이 공유하는 HTTP 세션 (get_session()으로 지연 생성)
+_session = None
 
 # ----------------------------------------------------------------------
 # 헬퍼 함수 (Helper Functions)
 # ----------------------------------------------------------------------
 
+async def get_session():
+    """공유 aiohttp 세션 반환 (최초 호출 시 생성, 이후 커넥션 재사용)"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=32, limit_per_host=8, keepalive_timeout=75, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def close_session():
+    """공유 aiohttp 세션 종료"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+PathInfo = namedtuple('PathInfo', ['is_resource', 'file_type', 'is_unity'])
+
+@lru_cache(maxsize=4096)
+def classify_path(file_path):
+    """파일 경로를 한 번만 분석하여 리소스 여부, 파일 타입, Unity 관련 여부를 함께 반환"""
+    ext = os.path.splitext(file_path)[1].lower()
+    is_resource_ext, file_type = EXTENSION_INFO.get(ext, (False, None))
+    return PathInfo(
+        is_resource=is_resource_ext or file_path.startswith(RESOURCE_DIRS),
+        file_type=file_type,
+        is_unity=any(pattern in file_path for pattern in UNITY_RELATED_PATTERNS)
+    )
+
 def is_resource_file(filename):
     """파일이 코드 리뷰에서 제외할 리소스 파일인지 확인"""
-    resource_extensions = {
-        '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp', '.ico', '.svg',
-        '.mp3', '.wav', '.ogg', '.m4a', '.aac', '.wma', '.flac', '.aiff', '.mid', '.midi',
-        '.unity3d', '.bank', '.fsb', '.vag', '.xma', '.xwb',
-        '.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm',
-        '.unity', '.prefab', '.asset', '.mat', '.anim', '.controller', '.mask', '.meta',
-        '.fbx', '.obj', '.blend', '.tga', '.psd', '.ai', '.pdf',
-        '.zip', '.rar', '.7z', '.tar', '.gz',
-        '.exe', '.dll', '.so', '.dylib', '.bin'
-    }
-    resource_dirs = {
-        'Assets/Resources', 'Assets/StreamingAssets', 'Assets/Textures', 'Assets/Models',
-        'Assets/Animations', 'Assets/Audio', 'Assets/Scenes', 'Assets/Prefabs',
-        'Assets/Materials', 'Assets/Sprites', 'Library', 'Temp', 'Logs'
-    }
-    ext = os.path.splitext(filename)[1].lower()
-    if ext in resource_extensions:
-        return True
-    for dir_path in resource_dirs:
-        if filename.startswith(dir_path):
-            return True
-    return False
+    return classify_path(filename).is_resource
 
 def detect_file_type(file_path):
     """파일 경로에서 확장자를 추출하여 파일 타입 반환"""
-    extensions = {
-        '.py': 'python', '.js': 'javascript', '.html': 'html', '.css': 'css',
-        '.ts': 'typescript', '.jsx': 'react', '.tsx': 'react', '.java': 'java',
-        '.c': 'c', '.cpp': 'cpp', '.cs': 'csharp', '.go': 'go', '.rs': 'rust',
-        '.rb': 'ruby', '.php': 'php', '.sql': 'sql', '.shader': 'unity-shader',
-        '.anim': 'unity-animation', '.prefab': 'unity-prefab', '.mat': 'unity-material',
-        '.asset': 'unity-asset', '.unity': 'unity-scene'
-    }
-    ext = os.path.splitext(file_path)[1].lower()
-    return extensions.get(ext)
+    return classify_path(file_path).file_type
 
 def is_unity_related(file_path):
     """파일이 Unity 프로젝트와 관련되어 있는지 확인"""
-    unity_related_patterns = [
-        'Assets/', '.cs', '.shader', '.anim', '.prefab', '.mat', '.unity',
-        'ProjectSettings/', 'Packages/', 'Assembly-CSharp', 'ScriptableObject'
-    ]
-    return any(pattern in file_path for pattern in unity_related_patterns)
+    return classify_path(file_path).is_unity
+
+class TokenBucket:
+    """초당 rate개씩 토큰이 채워지는 비동기 요청 속도 제한기 (async with로 토큰 1개 소비)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """지정한 시간(초) 동안 새 요청을 보류"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+github_bucket = TokenBucket(GH_RATE_LIMIT_PER_SEC)
+github_semaphore = asyncio.Semaphore(GH_MAX_CONCURRENCY)
+
+def _github_reset_wait(resp):
+    """1차 속도 제한(X-RateLimit-Remaining: 0) 응답이면 리셋까지 남은 시간(초), 아니면 None"""
+    reset = resp.headers.get('X-RateLimit-Reset')
+    if resp.headers.get('X-RateLimit-Remaining') == '0' and reset and reset.isdigit():
+        return max(int(reset) - time.time(), 1)
+    return None
+
+def _github_retry_delay(resp, attempt):
+    """GitHub 응답 헤더(Retry-After, X-RateLimit-*)를 고려한 재시도 대기 시간 계산"""
+    retry_after = resp.headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), GH_MAX_BACKOFF)
+    reset_wait = _github_reset_wait(resp)
+    if reset_wait is not None:
+        return min(reset_wait, GH_MAX_BACKOFF)
+    return min(2 ** attempt + random.random(), GH_MAX_BACKOFF)
+
+def _is_github_rate_limited(resp):
+    """속도 제한(1차 또는 2차)으로 거부된 응답인지 확인"""
+    return resp.status in (403, 429) and (
+        'Retry-After' in resp.headers or resp.headers.get('X-RateLimit-Remaining') == '0'
+    )
+
+def _is_github_retryable(resp):
+    """일시적인 오류(5xx, 429, 속도 제한 403)인지 확인 (1차 속도 제한의 리셋이 먼 경우는 제외)"""
+    if 'Retry-After' not in resp.headers:
+        reset_wait = _github_reset_wait(resp)
+        if reset_wait is not None and reset_wait > GH_MAX_BACKOFF:
+            return False
+    return resp.status in GH_RETRY_STATUSES or _is_github_rate_limited(resp)
+
+@asynccontextmanager
+async def github_get(url, headers):
+    """동시 요청 수 제한, 속도 제한과 지수 백오프 재시도를 적용한 GitHub API GET 요청"""
+    async with github_semaphore:
+        session = await get_session()
+        attempt = 0
+        while True:
+            async with github_bucket:
+                resp = await session.get(url, headers=headers)
+            reset_wait = _github_reset_wait(resp)
+            if reset_wait is not None and reset_wait <= GH_MAX_BACKOFF:
+                # 남은 요청 수를 모두 썼다면 곧 돌아올 리셋 시점까지 새 요청 보류
+                github_bucket.pause(reset_wait)
+            if attempt >= GH_MAX_RETRIES or not _is_github_retryable(resp):
+                if resp.status >= 400 and reset_wait is not None and reset_wait > GH_MAX_BACKOFF:
+                    reset_at = time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(int(resp.headers['X-RateLimit-Reset'])))
+                    logger.error(f"GitHub API rate limit exhausted until {reset_at} ({reset_wait:.0f}s). Not retrying.")
+                break
+            delay = _github_retry_delay(resp, attempt)
+            resp.release()
+            attempt += 1
+            logger.warning(f"GitHub API returned {resp.status}. Retrying in {delay:.1f}s ({attempt}/{GH_MAX_RETRIES})...")
+            await asyncio.sleep(delay)
+        try:
+            yield resp
+        finally:
+            resp.release()
 
 async def test_api_token_access(owner_repo):
     """API 토큰이 레포지토리에 접근 가능한지 테스트하는 진단 함수"""
@@ -96,21 +273,49 @@ async def test_api_token_access(owner_repo):
     headers = {'Accept': 'application/vnd.github.v3+json', 'Authorization': f'token {GH_API_TOKEN}'}
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(test_url, headers=headers) as resp:
-                if resp.status == 200:
-                    logger.info("✅ API token has valid access to the repository.")
-                    return True
-                else:
-                    error_info = await resp.json()
-                    logger.error(f"❌ API token access test failed! Status: {resp.status}")
-                    logger.error(f"Error Message: {error_info.get('message', 'No message')}")
-                    logger.error("Please check if the token has 'repo' scope and is authorized for SSO if it's an organization repository.")
-                    return False
+        async with github_get(test_url, headers) as resp:
+            if resp.status == 200:
+                logger.info("✅ API token has valid access to the repository.")
+                return True
+            else:
+                error_info = await resp.json()
+                logger.error(f"❌ API token access test failed! Status: {resp.status}")
+                logger.error(f"Error Message: {error_info.get('message', 'No message')}")
+                logger.error("Please check if the token has 'repo' scope and is authorized for SSO if it's an organization repository.")
+                return False
     except Exception as e:
         logger.error(f"An unexpected error occurred during API access test: {e}")
         return False
 
+def _iter_diff_headers(data, end):
+    """data[:end]에서 'diff --git' 헤더 줄마다 (시작 위치, 파일 경로) 반환 (경로만 디코딩)"""
+    if data.startswith(DIFF_HEADER):
+        start = 0
+    else:
+        found = data.find(b'\n' + DIFF_HEADER, 0, end)
+        start = found + 1 if found >= 0 else -1
+    while start >= 0:
+        line_end = data.find(b'\n', start, end)
+        if line_end < 0:
+            line_end = end
+        # a/path/to/file b/path/to/file 에서 파일 경로 추출
+        yield start, data[start:line_end].rsplit(b' b/', 1)[-1].decode('utf-8', 'replace')
+        found = data.find(b'\n' + DIFF_HEADER, line_end, end)
+        start = found + 1 if found >= 0 else -1
+
+def _filter_diff_block(data, end, buf, current_file_is_resource):
+    """data[:end]의 완결된 줄들에서 리소스 파일 블록을 제외하고 buf에 기록한 뒤, 마지막 파일의 리소스 여부 반환"""
+    pos = 0
+    # 파일 헤더 사이의 구간이 하나의 파일 블록
+    for header_start, file_path in _iter_diff_headers(data, end):
+        if not current_file_is_resource:
+            buf += data[pos:header_start]
+        pos = header_start
+        current_file_is_resource = is_resource_file(file_path)
+    if not current_file_is_resource:
+        buf += data[pos:end]
+    return current_file_is_resource
+
 async def get_code_diff(diff_url):
     """GitHub API로 diff 내용 가져오기"""
     if not GH_API_TOKEN:
@@ -118,27 +323,39 @@ async def get_code_diff(diff_url):
         return None
     headers = {'Accept': 'application/vnd.github.v3.diff', 'Authorization': f'token {GH_API_TOKEN}'}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(diff_url, headers=headers) as resp:
-                resp.raise_for_status()
-                diff_text = await resp.text()
-                
-                # 리소스 파일 제외 및 diff 정리
-                filtered_diff_lines = []
-                current_file_is_resource = False
-                for line in diff_text.split('\n'):
-                    if line.startswith('diff --git'):
-                        # a/path/to/file b/path/to/file 에서 파일 경로 추출
-                        try:
-                            file_path = line.split(' b/')[-1]
-                            current_file_is_resource = is_resource_file(file_path)
-                        except IndexError:
-                            current_file_is_resource = False
-                    
-                    if not current_file_is_resource:
-                        filtered_diff_lines.append(line)
-
-                return '\n'.join(filtered_diff_lines)
+        async with github_get(diff_url, headers) as resp:
+            if resp.status in (401, 403, 404):
+                # 별도의 토큰 테스트 요청 없이 실패한 응답으로 바로 원인 진단
+                error_body = await resp.text()
+                try:
+                    error_message = orjson.loads(error_body).get('message', 'No message')
+                except (orjson.JSONDecodeError, AttributeError):
+                    error_message = error_body.strip() or 'No message'
+                logger.error(f"❌ Failed to fetch diff! Status: {resp.status}")
+                logger.error(f"Error Message: {error_message}")
+                if _is_github_rate_limited(resp):
+                    logger.error("GitHub API rate limit exceeded. Please try again after the rate limit resets.")
+                else:
+                    logger.error("Please check if the token has 'repo' scope and is authorized for SSO if it's an organization repository.")
+                return None
+            resp.raise_for_status()
+
+            # 리소스 파일 제외 및 diff 정리 (전체 응답을 메모리에 올리지 않고 받은 조각 단위로 처리)
+            # 바이트 단위로 걸러낸 뒤 마지막에 한 번만 디코딩
+            buf = bytearray()
+            current_file_is_resource = False
+            pending = bytearray()
+            async for chunk in resp.content.iter_any():
+                pending += chunk
+                # 마지막 줄바꿈까지의 완결된 줄만 처리하고 나머지는 다음 조각과 합침
+                line_end = pending.rfind(b'\n') + 1
+                if line_end:
+                    current_file_is_resource = _filter_diff_block(pending, line_end, buf, current_file_is_resource)
+                    del pending[:line_end]
+            if pending:
+                _filter_diff_block(pending, len(pending), buf, current_file_is_resource)
+
+            return buf.decode('utf-8', 'replace')
     except aiohttp.ClientResponseError as e:
         logger.error(f"Error fetching diff: {e.status}, message='{e.message}', url='{diff_url}'")
         return None
@@ -146,35 +363,122 @@ async def get_code_diff(diff_url):
         logger.error(f"An unexpected error occurred while fetching diff: {e}")
         return None
 
-async def get_ai_code_review(diff_text):
-    """Gemini AI를 이용해 리뷰 생성"""
-    if not model:
-        return "Gemini 모델이 초기화되지 않았습니다. API 키를 확인해주세요."
+def compact_diff(diff_text):
+    """diff에서 리뷰에 불필요한 줄(문맥 줄, ---/+++ 헤더, 바이너리 표시, 공백뿐인 변경) 제거"""
+    lines = []
+    in_file_header = False
+    # splitlines()는 \x0c, \u2028 등에서도 줄을 나누므로 '\n' 기준으로만 분리
+    for line in diff_text.split('\n'):
+        if line.startswith('diff --git'):
+            in_file_header = True
+        elif line.startswith('@@'):
+            in_file_header = False
+        elif in_file_header:
+            # 첫 hunk 이전의 파일 헤더 줄(index, ---/+++, Binary files 등)은 제외
+            continue
+        elif not line.startswith(('+', '-')) or not line[1:].strip():
+            continue
+        lines.append(line)
+    return '\n'.join(lines)
+
+def _open_review_cache():
+    """리뷰 캐시 DB 연결 (테이블이 없으면 생성)"""
+    conn = sqlite3.connect(REVIEW_CACHE_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache (hash TEXT PRIMARY KEY, review TEXT, ts INTEGER)")
+    return conn
+
+def _load_cached_review(cache_key):
+    """캐시에서 유효 기간 내의 리뷰 조회 (없으면 None)"""
+    with closing(_open_review_cache()) as conn:
+        row = conn.execute(
+            "SELECT review FROM cache WHERE hash = ? AND ts > ?",
+            (cache_key, int(time.time()) - REVIEW_CACHE_TTL)
+        ).fetchone()
+    return row[0] if row else None
+
+def _store_cached_review(cache_key, review):
+    """생성된 리뷰를 캐시에 저장하고 만료된 항목 정리"""
+    now = int(time.time())
+    with closing(_open_review_cache()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO cache (hash, review, ts) VALUES (?, ?, ?)", (cache_key, review, now))
+        conn.execute("DELETE FROM cache WHERE ts <= ?", (now - REVIEW_CACHE_TTL,))
+
+async def stream_ai_code_review(diff_text):
+    """Gemini AI를 이용해 리뷰 생성 (생성되는 대로 텍스트 조각을 반환하는 async generator)"""
+    if not GEMINI_API_KEY:
+        logger.error("GEMINI_API_KEY is not set. AI review will not be available.")
+        yield "Gemini 모델이 초기화되지 않았습니다. API 키를 확인해주세요."
+        return
+    # 토큰 절약을 위해 변경되지 않은 문맥 줄 등을 제거한 diff 사용
+    diff_text = compact_diff(diff_text) if diff_text else diff_text
     if not diff_text:
-        return "코드 변경 사항이 없어 리뷰를 생성할 수 없습니다."
-    
-    prompt = f"""
-As an expert code reviewer, please analyze the following code changes (`git diff` format).
-Provide your feedback in Korean, using markdown for clarity. Structure your review with these sections:
-
-1.  **📝 변경사항 요약 (Summary):** Briefly describe the main purpose of these changes.
-2.  **✅ 좋은 점 (Pros):** Point out well-implemented parts or good practices.
-3.  **🤔 개선 제안 (Suggestions):** Suggest improvements for readability, performance, or potential issues.
-4.  **❓ 질문 (Questions):** Ask questions if the intent of the code is unclear.
+        yield "코드 변경 사항이 없어 리뷰를 생성할 수 없습니다."
+        return
 
----
+    # 모델이나 프롬프트가 바뀌면 이전 리뷰를 재사용하지 않도록 모델명과 전체 프롬프트로 캐시 키 생성
+    prompt = REVIEW_PROMPT_PREFIX + diff_text + REVIEW_PROMPT_SUFFIX
+    cache_key = hashlib.sha256(f"{GEMINI_MODEL}\n{prompt}".encode('utf-8')).hexdigest()
+    try:
+        cached_review = await asyncio.to_thread(_load_cached_review, cache_key)
+    except Exception as e:
+        logger.warning(f"Failed to read review cache: {e}")
+        cached_review = None
+    if cached_review is not None:
+        logger.info(f"Using cached review {cache_key[:12]}.")
+        yield cached_review
+        return
 
-**Code Changes:**
-```diff
-{diff_text}
-```
-"""
+    review_parts = []
+    finish_reason = None
     try:
-        response = await model.generate_content_async(prompt)
-        return response.text
+        session = await get_session()
+        payload = orjson.dumps({'contents': [{'parts': [{'text': prompt}]}]})
+        headers = {'x-goog-api-key': GEMINI_API_KEY, 'Content-Type': 'application/json'}
+        async with session.post(GEMINI_API_URL, data=payload, headers=headers) as resp:
+            if resp.status >= 300:
+                result = await resp.json(content_type=None)
+                error_message = result.get('error', {}).get('message', 'No message')
+                raise RuntimeError(f"Gemini API returned error {resp.status}: {error_message}")
+            # Server-Sent Events: 각 'data:' 줄이 생성된 텍스트 일부를 담은 JSON
+            async for line in resp.content:
+                if not line.startswith(b'data:'):
+                    continue
+                result = orjson.loads(line[5:])
+                if result.get('error'):
+                    # 스트리밍 도중 전달된 오류 이벤트
+                    error_message = result['error'].get('message', 'No message')
+                    raise RuntimeError(f"Gemini API returned error during streaming: {error_message}")
+                candidates = result.get('candidates')
+                if not candidates:
+                    # usageMetadata만 담긴 조각 등은 건너뛰고, 프롬프트가 차단된 경우만 오류 처리
+                    block_reason = result.get('promptFeedback', {}).get('blockReason')
+                    if block_reason:
+                        raise RuntimeError(f"Gemini API blocked the prompt: {block_reason}")
+                    continue
+                finish_reason = candidates[0].get('finishReason', finish_reason)
+                text = ''.join(part.get('text', '') for part in candidates[0].get('content', {}).get('parts', []))
+                if text:
+                    review_parts.append(text)
+                    yield text
+        if not review_parts:
+            # 안전 필터, 출력 토큰 소진(MAX_TOKENS) 등으로 텍스트 없이 끝난 경우는 실패로 처리 (캐시하지 않음)
+            raise RuntimeError(f"Gemini API returned an empty review (finishReason: {finish_reason})")
     except Exception as e:
         logger.error(f"Error generating code review from Gemini: {e}")
-        return f"코드 리뷰 생성 중 오류가 발생했습니다: {str(e)}"
+        separator = "\n\n" if review_parts else ""
+        yield f"{separator}코드 리뷰 생성 중 오류가 발생했습니다: {str(e)}"
+        return
+
+    if finish_reason != 'STOP':
+        # MAX_TOKENS, SAFETY 등으로 중간에 끊긴 리뷰는 안내 문구를 덧붙이고 캐시하지 않음
+        logger.warning(f"Gemini review was truncated (finishReason: {finish_reason}). Not caching.")
+        yield f"\n\n⚠️ 리뷰가 중간에 잘렸습니다 (finishReason: {finish_reason})"
+        return
+
+    try:
+        await asyncio.to_thread(_store_cached_review, cache_key, ''.join(review_parts))
+    except Exception as e:
+        logger.warning(f"Failed to write review cache: {e}")
 
 async def send_to_discord(data):
     """Discord에 메시지 전송"""
@@ -182,25 +486,84 @@ async def send_to_discord(data):
         logger.error("DISCORD_WEBHOOK_URL is not set. Cannot send message.")
         return
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(DISCORD_WEBHOOK_URL, json=data) as resp:
-                if resp.status >= 300:
-                    logger.error(f"Discord API returned error {resp.status}: {await resp.text()}")
-                else:
-                    logger.info(f"Successfully sent message to Discord (status: {resp.status}).")
+        session = await get_session()
+        headers = {'Content-Type': 'application/json'}
+        async with session.post(DISCORD_WEBHOOK_URL, data=orjson.dumps(data), headers=headers) as resp:
+            if resp.status >= 300:
+                logger.error(f"Discord API returned error {resp.status}: {await resp.text()}")
+            else:
+                logger.info(f"Successfully sent message to Discord (status: {resp.status}).")
     except Exception as e:
         logger.error(f"Error sending to Discord: {e}")
 
-def split_review_into_messages(review_text, max_length=1900):
+async def send_review_parts(queue, base_embed):
+    """큐에 들어오는 리뷰 조각을 순서대로 Discord에 전송 (None을 받으면 종료)"""
+    part_number = 0
+    finished = False
+    while not finished:
+        # 전송하는 동안 쌓인 조각은 한 번에 모아 embed 묶음으로 전송
+        parts = [await queue.get()]
+        while not queue.empty():
+            parts.append(queue.get_nowait())
+        if parts[-1] is None:
+            parts.pop()
+            finished = True
+
+        # 리뷰 전체가 한 조각이면 번호 없이, 여러 조각이면 (1), (2) ... 형식으로 표시
+        single_part = finished and part_number == 0 and len(parts) == 1
+        embeds = []
+        for message_part in parts:
+            part_number += 1
+            embed = base_embed.copy()
+            if not single_part:
+                embed['title'] += f" ({part_number})"
+            embed['description'] = message_part
+            embeds.append(embed)
+
+        for batch in batch_embeds(embeds):
+            await send_to_discord({'username': 'AI 코드 리뷰 봇', 'embeds': batch})
+
+def _embed_length(embed):
+    """Discord가 메시지 길이 제한에 포함하는 embed 문자 수 계산"""
+    return (
+        len(embed.get('title', '')) + len(embed.get('description', ''))
+        + len(embed.get('footer', {}).get('text', ''))
+    )
+
+def batch_embeds(embeds, max_embeds=DISCORD_MAX_EMBEDS, max_chars=DISCORD_MAX_EMBED_CHARS):
+    """embed 목록을 Discord 메시지 하나에 담을 수 있는 묶음(개수 및 총 문자 수 제한)으로 분할"""
+    batches = []
+    batch, batch_chars = [], 0
+    for embed in embeds:
+        length = _embed_length(embed)
+        if batch and (len(batch) >= max_embeds or batch_chars + length > max_chars):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(embed)
+        batch_chars += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+def load_event_payload(event_path):
+    """GitHub 이벤트 페이로드 파일 읽기"""
+    with open(event_path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def split_review_into_messages(review_text, max_length=DISCORD_MESSAGE_MAX_LENGTH):
     """리뷰 텍스트를 Discord 메시지 최대 길이에 맞게 분할"""
     messages = []
-    while len(review_text) > max_length:
-        split_pos = review_text.rfind('\n', 0, max_length)
-        if split_pos == -1:
-            split_pos = max_length
-        messages.append(review_text[:split_pos])
-        review_text = review_text[split_pos:].lstrip()
-    messages.append(review_text)
+    start, end = 0, len(review_text)
+    # 남은 꼬리 문자열을 매번 복사하지 않도록 원본 문자열 위에서 인덱스만 이동
+    while end - start > max_length:
+        split_pos = review_text.rfind('\n', start, start + max_length)
+        if split_pos <= start:
+            split_pos = start + max_length
+        messages.append(review_text[start:split_pos])
+        start = split_pos
+        while start < end and review_text[start].isspace():
+            start += 1
+    messages.append(review_text[start:])
     return messages
 
 # ----------------------------------------------------------------------
@@ -217,8 +580,10 @@ async def main():
         logger.error("GITHUB_EVENT_PATH not found.")
         sys.exit(1)
 
-    with open(event_path, 'r') as f:
-        payload = json.load(f)
+    # 이벤트 파일 읽기는 별도 스레드에서 처리하고, 그동안 공유 세션을 미리 생성
+    session_task = asyncio.create_task(get_session())
+    payload = await asyncio.to_thread(load_event_payload, event_path)
+    await session_task
 
     # 이벤트 유형에 따라 정보 추출
     if event_name == 'push':
@@ -250,22 +615,19 @@ async def main():
         logger.warning(f"Unsupported event type: {event_name}. Exiting.")
         return
 
-    # API 토큰 접근 권한 테스트
-    if not await test_api_token_access(owner_repo):
+    # API 토큰 접근 권한 테스트 (--diagnose 옵션 사용 시에만, 기본은 diff 요청 응답으로 진단)
+    if '--diagnose' in sys.argv[1:] and not await test_api_token_access(owner_repo):
         logger.error("Exiting due to failed API token access test.")
         return
 
-    # diff 가져오기 (URL에 .diff 확장자 추가)
+    # diff 가져오기
     logger.info(f"Fetching diff from: {diff_url}")
-    diff_text = await get_code_diff(f"{diff_url}")
+    diff_text = await get_code_diff(diff_url)
     if not diff_text or not diff_text.strip():
         logger.info("No code changes found to review. Exiting.")
         return
 
-    # AI 리뷰 생성
-    review_text = await get_ai_code_review(diff_text)
-
-    # Discord 메시지 구성 및 전송
+    # Discord 메시지 구성
     base_embed = {
         'title': f"🤖 코드 리뷰: {title}",
         'url': target_url,
@@ -274,16 +636,29 @@ async def main():
         'timestamp': datetime.utcnow().isoformat()
     }
 
-    review_messages = split_review_into_messages(review_text)
-    for i, message_part in enumerate(review_messages, 1):
-        embed = base_embed.copy()
-        if len(review_messages) > 1:
-            embed['title'] += f" ({i}/{len(review_messages)})"
-        embed['description'] = message_part
-        
-        await send_to_discord({'username': 'AI 코드 리뷰 봇', 'embeds': [embed]})
+    # AI 리뷰를 스트리밍으로 생성하면서, 메시지 길이만큼 모인 조각부터 Discord로 전송
+    queue = asyncio.Queue()
+    sender_task = asyncio.create_task(send_review_parts(queue, base_embed))
+    pending = ''
+    async for text in stream_ai_code_review(diff_text):
+        pending += text
+        if len(pending) > DISCORD_MESSAGE_MAX_LENGTH:
+            *ready_parts, pending = split_review_into_messages(pending)
+            for message_part in ready_parts:
+                queue.put_nowait(message_part)
+    for message_part in split_review_into_messages(pending):
+        if message_part:
+            queue.put_nowait(message_part)
+    queue.put_nowait(None)
+    await sender_task
 
     logger.info("Code review process completed successfully.")
 
+async def run():
+    try:
+        await main()
+    finally:
+        await close_session()
+
 if __name__ == '__main__':
-    asyncio.run(main())
+    asyncio.run(run())